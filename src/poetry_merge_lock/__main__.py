@@ -1,19 +1,52 @@
 """Command-line interface."""
+from typing import Any
+from typing import Dict
+from typing import Optional
+
 import click
 from poetry.factory import Factory
 from poetry.utils._compat import Path
 
+from . import diff as difftool
+from .core import load_toml_versions
 from .core import merge_lock
+from .mergetool import Preference
+from .store import FileStore
+from .watch import watch as watch_lock
+from .watch import Watcher
 
 
-@click.command()
+@click.group(invoke_without_command=True)
 @click.option(
     "--print-content-hash",
     is_flag=True,
     help="Print the content hash (`metadata.content-hash`)",
 )
+@click.option(
+    "--prefer",
+    type=click.Choice([preference.value for preference in Preference]),
+    help="Resolve conflicting package versions using this policy",
+)
+@click.option(
+    "--store",
+    type=click.Path(file_okay=False),
+    envvar="POETRY_MERGE_LOCK_STORE",
+    help="Directory for sharing package files between merges",
+)
+@click.option(
+    "--merge-stored-files",
+    is_flag=True,
+    help="Merge conflicting package files if the store recorded all of them",
+)
 @click.version_option()
-def main(print_content_hash: bool) -> None:
+@click.pass_context
+def main(
+    context: click.Context,
+    print_content_hash: bool,
+    prefer: Optional[str],
+    store: Optional[str],
+    merge_stored_files: bool,
+) -> None:
     """Merge the lock file of a Poetry project.
 
     This is a tool for resolving merge conflicts in the lock file of
@@ -21,17 +54,140 @@ def main(print_content_hash: bool) -> None:
     conflicts cannot be resolved by this tool, you can use the
     --print-content-hash option to compute the content hash for the
     metadata.content-hash entry, and resolve the conflicts manually.
+
+    Use the --prefer option to select our version, their version, or the
+    newest version of every conflicting package. Packages which cannot be
+    merged are resolved using the dependency solver, keeping all other
+    packages at their locked versions.
+
+    Use the --store option to record package files in a directory shared
+    between projects. Use the prune-store command to limit the size of the
+    directory. With the --merge-stored-files option, conflicting package
+    files are merged if every file was recorded for the same package version
+    in earlier merges. Note that this can restore a file or hash which was
+    removed deliberately on one side.
     \f
 
     Args:
+        context: The Click context.
         print_content_hash: Print the content hash.
+        prefer: The policy for resolving conflicting package versions.
+        store: The directory for sharing package files between merges.
+        merge_stored_files: Merge conflicting package files using the store.
+
+    Raises:
+        UsageError: --merge-stored-files was passed without --store.
     """
+    if merge_stored_files and store is None:
+        raise click.UsageError("--merge-stored-files requires --store")
+
+    context.obj = {
+        "prefer": Preference(prefer) if prefer is not None else None,
+        "store": (
+            FileStore(Path(store), merge_stored_files) if store is not None else None
+        ),
+    }
+
+    if context.invoked_subcommand is not None:
+        return
+
     poetry = Factory().create_poetry(Path.cwd())
 
     if print_content_hash:
         click.echo(poetry.locker._content_hash)
     else:
-        merge_lock(poetry)
+        merge_lock(poetry, context.obj["prefer"], context.obj["store"])
+
+
+@main.command()
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["text", "json"]),
+    default="text",
+    show_default=True,
+    help="Output format",
+)
+@click.argument(
+    "lock_file",
+    type=click.Path(exists=True, dir_okay=False),
+    default="poetry.lock",
+)
+def diff(output_format: str, lock_file: str) -> None:
+    """List the packages changed by a merge conflict.
+
+    Packages are listed as added, removed, or changed in their version,
+    together with version changes and changes to the package files. The
+    dependency solver is not invoked.
+    \f
+
+    Args:
+        output_format: The output format, ``text`` or ``json``.
+        lock_file: Path to the lock file.
+    """
+    ours, theirs = load_toml_versions(Path(lock_file))
+    changes = difftool.diff(ours, theirs)
+    if output_format == "json":
+        click.echo(difftool.format_json(changes))
+    else:
+        click.echo(difftool.format_text(changes))
+
+
+@main.command(name="prune-store")
+@click.option(
+    "--max-size",
+    type=click.IntRange(min=0),
+    required=True,
+    help="Maximum size of the store in bytes",
+)
+@click.argument(
+    "directory",
+    type=click.Path(file_okay=False),
+    envvar="POETRY_MERGE_LOCK_STORE",
+)
+def prune_store(max_size: int, directory: str) -> None:
+    """Remove the least recently used package files from the store.
+
+    Entries are removed until the store fits into the maximum size.
+    \f
+
+    Args:
+        max_size: The maximum size of the store in bytes.
+        directory: The directory containing the store.
+    """
+    removed = FileStore(Path(directory)).prune(max_size)
+    click.echo("Removed {} entries".format(removed))
+
+
+@main.command()
+@click.option(
+    "--interval",
+    type=click.FloatRange(min=0.01),
+    default=0.5,
+    show_default=True,
+    help="Seconds between checks of the lock file",
+)
+@click.pass_obj
+def watch(options: Dict[str, Any], interval: float) -> None:
+    """Resolve merge conflicts in the lock file as they appear.
+
+    This keeps running in the background, for example during an interactive
+    rebase. Whenever the lock file contains conflict markers, they are
+    resolved and the lock file is staged. The --prefer and --store options
+    apply as for the main command.
+    \f
+
+    Args:
+        options: The options of the main command.
+        interval: The number of seconds between checks of the lock file.
+    """
+    watcher = Watcher(Path.cwd(), options["prefer"], options["store"])
+
+    for error in watch_lock(watcher, interval):
+        if error is None:
+            click.echo("Resolved merge conflicts in poetry.lock")
+        else:
+            click.echo("Cannot resolve merge conflicts: {}".format(error), err=True)
 
 
 if __name__ == "__main__":
@@ -1,24 +1,72 @@
 """Core module."""
+from typing import AbstractSet
+from typing import Any
+from typing import Dict
 from typing import List
+from typing import Optional
 from typing import Sequence
+from typing import Set
 from typing import Tuple
+from typing import Union
 
 import tomlkit
+from poetry.io.null_io import NullIO
+from poetry.packages import Dependency
 from poetry.packages import Package
+from poetry.packages import ProjectPackage
 from poetry.packages.locker import Locker
 from poetry.poetry import Poetry
+from poetry.puzzle import Solver
+from poetry.puzzle.exceptions import SolverProblemError
+from poetry.repositories import Pool
+from poetry.repositories import Repository
 from poetry.utils._compat import Path
 from tomlkit.api import _TOMLDocument
 
 from . import mergetool
 from . import parser
+from .mergetool import MergeConflictError
+from .mergetool import Preference
+from .store import FileStore
 
 
-def load_toml_versions(toml_file: Path) -> Tuple[_TOMLDocument, _TOMLDocument]:
-    """Load a pair of TOML documents from a TOML file with merge conflicts.
+class UnsatisfiedDependencyError(ValueError):
+    """The locked packages do not satisfy the dependency constraints."""
+
+    def __init__(self, packages: AbstractSet[str]) -> None:
+        """Constructor."""
+        self.packages = sorted(packages)
+        message = "Unsatisfied dependency constraints for {}".format(
+            ", ".join(self.packages)
+        )
+        super().__init__(message)
+
+
+class MemoryLocker(Locker):  # type: ignore[misc]
+    """Locker which keeps the lock data in memory instead of on disk."""
+
+    def __init__(
+        self, local_config: Dict[str, Any], lock_data: Optional[_TOMLDocument] = None
+    ) -> None:
+        """Constructor."""
+        super().__init__(Path("poetry.lock"), local_config)
+        self._lock_data = lock_data
+
+    def is_locked(self) -> bool:
+        """Return True if the locker holds lock data."""
+        return self._lock_data is not None and "package" in self._lock_data
+
+    def _write_lock_data(self, data: _TOMLDocument) -> None:
+        self._lock_data = data
+
+
+def parse_toml_versions(
+    lines: Sequence[str],
+) -> Tuple[_TOMLDocument, _TOMLDocument]:
+    """Parse a pair of TOML documents from lines with merge conflicts.
 
     Args:
-        toml_file: Path to the lock file.
+        lines: The lines of the lock file.
 
     Returns:
         A pair of TOML documents, corresponding to *our* version and *their*
@@ -28,23 +76,22 @@ def load_toml_versions(toml_file: Path) -> Tuple[_TOMLDocument, _TOMLDocument]:
     def load(lines: Sequence[str]) -> _TOMLDocument:  # noqa
         return tomlkit.loads("".join(lines))
 
-    with toml_file.open() as fp:
-        ours, theirs = parser.parse(fp)
-        return load(ours), load(theirs)
+    ours, theirs = parser.parse(lines)
+    return load(ours), load(theirs)
 
 
-def load(locker: Locker) -> _TOMLDocument:
-    """Load a lock file with merge conflicts.
+def load_toml_versions(toml_file: Path) -> Tuple[_TOMLDocument, _TOMLDocument]:
+    """Load a pair of TOML documents from a TOML file with merge conflicts.
 
     Args:
-        locker: The locker object.
+        toml_file: Path to the lock file.
 
     Returns:
-        The merged TOML document.
+        A pair of TOML documents, corresponding to *our* version and *their*
+        version.
     """
-    lock_file = Path(locker.lock._path)
-    ours, theirs = load_toml_versions(lock_file)
-    return mergetool.merge(ours, theirs)
+    with toml_file.open() as fp:
+        return parse_toml_versions(fp)
 
 
 def activate_dependencies(packages: List[Package]) -> None:
@@ -67,22 +114,172 @@ def activate_dependencies(packages: List[Package]) -> None:
                 dependency.activate()
 
 
-def load_packages(locker: Locker, lock_data: _TOMLDocument) -> List[Package]:
+def load_packages(lock_data: _TOMLDocument) -> List[Package]:
     """Load the packages from a TOML document with lock data.
 
+    The packages are created from scratch on every call, and are owned by the
+    caller. No Poetry objects are shared with other callers.
+
     Args:
-        locker: The locker object.
         lock_data: The lock data.
 
     Returns:
         The list of packages.
     """
-    locker._lock_data = lock_data
+    locker = MemoryLocker({}, lock_data)
     repository = locker.locked_repository(with_dev_reqs=True)
     activate_dependencies(repository.packages)
     return repository.packages  # type: ignore[no-any-return]  # noqa: F723
 
 
+def find_unsatisfied_dependencies(
+    dependencies: List[Dependency], packages: Dict[str, Package]
+) -> Set[str]:
+    """Find the dependencies which are not satisfied by the locked packages.
+
+    A dependency may be declared several times with different constraints,
+    e.g. for different Python versions. It is satisfied if any of these
+    constraints allows the locked version. Dependencies without a locked
+    package are ignored.
+
+    Args:
+        dependencies: The dependencies to be checked.
+        packages: The locked packages, keyed by name.
+
+    Returns:
+        The names of the unsatisfied dependencies.
+    """
+    constraints: Dict[str, List[Dependency]] = {}
+
+    for dependency in dependencies:
+        constraints.setdefault(dependency.name, []).append(dependency)
+
+    return {
+        name
+        for name, dependencies in constraints.items()
+        if name in packages
+        and not any(
+            dependency.constraint.allows(packages[name].version)
+            for dependency in dependencies
+        )
+    }
+
+
+def find_requested_extras(root: Package, packages: List[Package]) -> Dict[str, Set[str]]:
+    """Find the extras requested by the project and the locked packages.
+
+    Args:
+        root: The root package of the Poetry project.
+        packages: The locked packages.
+
+    Returns:
+        The names of the requested extras, keyed by package name.
+    """
+    extras: Dict[str, Set[str]] = {}
+
+    for package in [root, *packages]:
+        for dependency in package.all_requires:
+            extras.setdefault(dependency.name, set()).update(dependency.extras)
+
+    return extras
+
+
+def find_required_dependencies(
+    package: Package, extras: AbstractSet[str]
+) -> List[Dependency]:
+    """Return the dependencies of a locked package which need to be satisfied.
+
+    Optional dependencies are only included if one of the requested extras of
+    the package enables them.
+
+    Args:
+        package: The locked package.
+        extras: The requested extras of the package.
+
+    Returns:
+        The required dependencies.
+    """
+    enabled = {
+        dependency.name
+        for extra in extras
+        for dependency in package.extras.get(extra, [])
+    }
+    return [
+        dependency
+        for dependency in package.requires
+        if not dependency.is_optional() or dependency.name in enabled
+    ]
+
+
+def check_dependencies(root: Package, packages: List[Package]) -> None:
+    """Check the locked packages against the dependency constraints.
+
+    This verifies the constraints from pyproject.toml, as well as those of the
+    locked packages themselves, without invoking the solver. Optional
+    dependencies of locked packages are only verified if an extra requested by
+    the project or by another locked package enables them.
+
+    Args:
+        root: The root package of the Poetry project.
+        packages: The locked packages.
+
+    Raises:
+        UnsatisfiedDependencyError: A locked package violates a constraint.
+    """
+    locked = {package.name: package for package in packages}
+    unsatisfied = find_unsatisfied_dependencies(root.all_requires, locked)
+
+    extras = find_requested_extras(root, packages)
+
+    for package in packages:
+        dependencies = find_required_dependencies(
+            package, extras.get(package.name, set())
+        )
+        unsatisfied |= find_unsatisfied_dependencies(dependencies, locked)
+
+    if unsatisfied:
+        raise UnsatisfiedDependencyError(unsatisfied)
+
+
+def dump_lock_data(
+    local_config: Dict[str, Any], root: Package, packages: List[Package]
+) -> _TOMLDocument:
+    """Create the lock data for the given packages.
+
+    Args:
+        local_config: The ``tool.poetry`` section of pyproject.toml.
+        root: The root package of the Poetry project.
+        packages: The locked packages.
+
+    Returns:
+        The lock data, including the metadata generated by Poetry.
+    """
+    locker = MemoryLocker(local_config)
+    locker.set_lock_data(root, packages)
+    return locker.lock_data
+
+
+def write(locker: Locker, root: Package, packages: List[Package]) -> None:
+    """Write the lock file, without modifying the locker object.
+
+    Like Poetry, this reads the lock file back to check that it was written
+    correctly.
+
+    Args:
+        locker: The locker object.
+        root: The root package of the Poetry project.
+        packages: The locked packages.
+
+    Raises:
+        RuntimeError: The lock file differs from the data written to it.
+    """
+    lock_data = dump_lock_data(locker._local_config, root, packages)
+    locker.lock.write(lock_data)
+
+    if lock_data != locker.lock.read():
+        raise RuntimeError("Inconsistent lock file data.")
+
+
 def save(locker: Locker, lock_data: _TOMLDocument, root: Package) -> None:
     """Validate the lock data and write it to disk.
 
@@ -91,11 +288,264 @@ def save(locker: Locker, lock_data: _TOMLDocument, root: Package) -> None:
         lock_data: The lock data.
         root: The root package of the Poetry project.
     """
-    packages = load_packages(locker, lock_data)
-    locker.set_lock_data(root, packages)
+    packages = load_packages(lock_data)
+    check_dependencies(root, packages)
+    write(locker, root, packages)
+
+
+def find_dependents(packages: List[Package], names: AbstractSet[str]) -> Set[str]:
+    """Find the packages which depend on the given packages.
+
+    Args:
+        packages: The locked packages.
+        names: The names of the packages whose dependents should be found.
+
+    Returns:
+        The names of the given packages, and of the packages which depend on
+        them, directly or indirectly.
+    """
+    dependents: Dict[str, Set[str]] = {}
+
+    for package in packages:
+        for dependency in package.requires:
+            dependents.setdefault(dependency.name, set()).add(package.name)
+
+    result = set(names)
+    queue = list(names)
+
+    while queue:
+        for name in dependents.get(queue.pop(), set()) - result:
+            result.add(name)
+            queue.append(name)
+
+    return result
+
+
+def find_locked_packages(ours: List[Package], theirs: List[Package]) -> List[Package]:
+    """Combine the locked packages from both versions of the lock file.
+
+    Packages from *their* version are only included if *our* version does not
+    lock a package with the same name. Packages whose versions differ between
+    both versions are meant to be passed to the solver, so the choice of
+    version does not matter for them.
+
+    Args:
+        ours: The packages in *our* version of the lock file.
+        theirs: The packages in *their* version of the lock file.
+
+    Returns:
+        The combined list of locked packages.
+    """
+    names = {package.name for package in ours}
+    return ours + [package for package in theirs if package.name not in names]
+
+
+def resolve(
+    root: Package,
+    pool: Pool,
+    packages: List[Package],
+    candidates: List[Package],
+    names: AbstractSet[str],
+) -> List[Package]:
+    """Resolve the dependencies of the given packages using Poetry's solver.
+
+    Only the given packages and their dependents are resolved. Every other
+    package is pinned to its locked version, and dependents keep their locked
+    versions if these still satisfy the constraints. The solver only considers
+    the locked packages and candidates, without accessing the network. The
+    repositories in the pool are only used if no solution can be found that
+    way.
+
+    Packages obtained from the locked packages or candidates keep their files,
+    which Poetry does not preserve when it copies packages. If several of them
+    have the same name and version, the package receives the union of their
+    files.
+
+    Args:
+        root: The root package of the Poetry project.
+        pool: The pool of package repositories.
+        packages: The locked packages.
+        candidates: Alternative versions of the given packages.
+        names: The names of the packages to be resolved.
+
+    Returns:
+        The list of resolved packages.
+    """
+    unlocked = find_dependents(packages, names)
+    versions = {(package.name, package.version) for package in packages}
+    files: Dict[Tuple[str, Any], List[Dict[str, str]]] = {}
+
+    for package in packages + candidates:
+        entries = files.setdefault((package.name, package.version), [])
+        for entry in package.files:
+            if entry not in entries:
+                entries.append(entry)
+
+    repository = Repository(packages)
+
+    for package in candidates:
+        if package.name in unlocked and (package.name, package.version) not in versions:
+            versions.add((package.name, package.version))
+            repository.add_package(package)
+
+    pinned = Repository([package for package in packages if package.name not in names])
+
+    try:
+        solver = Solver(root, Pool([repository]), Repository(), pinned, NullIO())
+        operations = solver.solve()
+    except SolverProblemError:
+        solver = Solver(
+            root, Pool([repository, *pool.repositories]), Repository(), pinned, NullIO()
+        )
+        operations = solver.solve()
+
+    result = [operation.package for operation in operations]
+
+    for package in result:
+        package.files = files.get((package.name, package.version), package.files)
+
+    return result
+
+
+def merge_lock(
+    poetry: Poetry,
+    prefer: Optional[Preference] = None,
+    store: Optional[FileStore] = None,
+) -> None:
+    """Resolve merge conflicts in Poetry's lock file.
+
+    If the merge conflicts cannot be resolved at the TOML level, the
+    conflicting packages and their dependents are passed to Poetry's solver,
+    keeping all other packages at their locked versions. Packages which only
+    differ in their files are locked with the files from both versions.
+
+    Args:
+        poetry: The Poetry object.
+        prefer: The policy for resolving conflicting package versions, if any.
+        store: The store of package files from earlier merges, if any. The
+            files of packages without conflicts are added to the store if
+            the merged lock file is consistent.
+    """
+    locker = poetry.locker
+    ours, theirs = load_toml_versions(Path(locker.lock._path))
+
+    try:
+        lock_data = mergetool.merge(ours, theirs, prefer, store)
+        save(locker, lock_data, poetry.package)
+    except (MergeConflictError, UnsatisfiedDependencyError) as error:
+        names = mergetool.find_package_conflicts(ours["package"], theirs["package"])
+        if isinstance(error, UnsatisfiedDependencyError):
+            names.update(error.packages)
+
+        our_packages = load_packages(ours)
+        their_packages = load_packages(theirs)
+        packages = resolve(
+            poetry.package,
+            poetry.pool,
+            find_locked_packages(our_packages, their_packages),
+            our_packages + their_packages,
+            names,
+        )
+        write(locker, poetry.package, packages)
+    else:
+        if store is not None:
+            conflicts = mergetool.find_conflicts(ours, theirs)
+            mergetool.add_package_files(lock_data, store, conflicts)
+
+
+SOURCE_KEYS = ("git", "branch", "tag", "rev", "file", "path", "develop", "url")
+
+
+def strip_source(constraint: Dict[str, Any]) -> Dict[str, Any]:
+    """Remove the source of a dependency from its constraint.
+
+    Poetry inspects the filesystem when it creates path and file dependencies.
+    Dependencies on a path, file, URL, or VCS repository allow any version, so
+    they are replaced by dependencies without a version constraint.
+
+    Args:
+        constraint: The constraint of a dependency in pyproject.toml.
+
+    Returns:
+        The constraint without the source of the dependency.
+    """
+    if not any(key in constraint for key in SOURCE_KEYS):
+        return constraint
+
+    result = {key: value for key, value in constraint.items() if key not in SOURCE_KEYS}
+    result["version"] = "*"
+    return result
+
+
+def create_package(local_config: Dict[str, Any]) -> ProjectPackage:
+    """Create the root package from the configuration in pyproject.toml.
+
+    Unlike Poetry's factory, this only loads the dependencies and extras of the
+    project, and does not access the filesystem. Dependencies on a path, file,
+    URL, or VCS repository are loaded without their source.
+
+    Args:
+        local_config: The ``tool.poetry`` section of pyproject.toml.
+
+    Returns:
+        The root package of the Poetry project.
+    """
+    version = local_config["version"]
+    package = ProjectPackage(local_config["name"], version, version)
+
+    for section, category in [("dependencies", "main"), ("dev-dependencies", "dev")]:
+        for name, value in local_config.get(section, {}).items():
+            if section == "dependencies" and name.lower() == "python":
+                package.python_versions = value
+                continue
+
+            constraints = value if isinstance(value, list) else [value]
+            for constraint in constraints:
+                if isinstance(constraint, dict):
+                    constraint = strip_source(constraint)
+                package.add_dependency(name, constraint, category=category)
+
+    for extra, requirements in local_config.get("extras", {}).items():
+        names = {Dependency(requirement, "*").name for requirement in requirements}
+        package.extras[extra] = [
+            dependency for dependency in package.requires if dependency.name in names
+        ]
+        for dependency in package.extras[extra]:
+            dependency.in_extras.append(extra)
+
+    return package
+
+
+def merge_lock_text(
+    lock: Union[str, bytes],
+    pyproject: Union[str, bytes],
+    prefer: Optional[Preference] = None,
+) -> str:
+    """Resolve merge conflicts in the contents of Poetry's lock file.
+
+    This function works entirely in memory, without accessing the filesystem.
+    It does not invoke the dependency solver, so conflicts which cannot be
+    resolved at the TOML level result in an exception. No state is shared
+    between calls, so the function can be called from multiple threads.
+
+    Args:
+        lock: The contents of the lock file, with merge conflicts.
+        pyproject: The contents of pyproject.toml.
+        prefer: The policy for resolving conflicting package versions, if any.
+
+    Returns:
+        The contents of the merged lock file.
+    """
+    if isinstance(lock, bytes):
+        lock = lock.decode()
 
+    if isinstance(pyproject, bytes):
+        pyproject = pyproject.decode()
 
-def merge_lock(poetry: Poetry) -> None:
-    """Resolve merge conflicts in Poetry's lock file."""
-    lock_data = load(poetry.locker)
-    save(poetry.locker, lock_data, poetry.package)
+    local_config = tomlkit.loads(pyproject)["tool"]["poetry"]
+    root = create_package(local_config)
+    ours, theirs = parse_toml_versions(lock.splitlines(keepends=True))
+    packages = load_packages(mergetool.merge(ours, theirs, prefer))
+    check_dependencies(root, packages)
+    lock_data = dump_lock_data(local_config, root, packages)
+    return tomlkit.dumps(lock_data)  # type: ignore[no-any-return]
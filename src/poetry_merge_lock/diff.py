@@ -0,0 +1,158 @@
+"""Package-level differences between two versions of lock data."""
+import json
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from tomlkit.api import _TOMLDocument
+
+from . import mergetool
+
+
+class PackageChange(NamedTuple):
+    """A package which differs between two versions of lock data.
+
+    Attributes:
+        name: The package name.
+        ours: The package version in *our* version, if any.
+        theirs: The package version in *their* version, if any.
+        files_added: Files only listed in *their* version.
+        files_removed: Files only listed in *our* version.
+        files_changed: Files listed with different hashes in both versions.
+    """
+
+    name: str
+    ours: Optional[str]
+    theirs: Optional[str]
+    files_added: List[str]
+    files_removed: List[str]
+    files_changed: List[str]
+
+    @property
+    def status(self) -> str:
+        """Return ``added``, ``removed``, or ``changed``."""
+        if self.ours is None:
+            return "added"
+
+        if self.theirs is None:
+            return "removed"
+
+        return "changed"
+
+
+def list_files(files: Optional[List[Dict[str, str]]]) -> Set[Tuple[str, str]]:
+    """Return the files in a ``metadata.files`` entry.
+
+    Args:
+        files: The entry, if any.
+
+    Returns:
+        The file names, paired with their hashes.
+    """
+    return {(str(file["file"]), str(file["hash"])) for file in files or []}
+
+
+def diff(value: _TOMLDocument, other: _TOMLDocument) -> List[PackageChange]:
+    """Compare two versions of lock data at the package level.
+
+    Args:
+        value: Our version of the lock data.
+        other: Their version of the lock data.
+
+    Returns:
+        The packages which were added, removed, or changed in *their* version,
+        ordered by name.
+    """
+    ours = mergetool.index_packages(value["package"])
+    theirs = mergetool.index_packages(other["package"])
+    our_files = value["metadata"]["files"]
+    their_files = other["metadata"]["files"]
+    changes = []
+
+    for name in sorted(ours.keys() | theirs.keys()):
+        a = ours.get(name)
+        b = theirs.get(name)
+        files = list_files(our_files.get(name))
+        other_files = list_files(their_files.get(name))
+
+        unchanged = a is not None and b is not None and a.value == b.value
+        if unchanged and files == other_files:
+            continue
+
+        names = {file for file, _ in files}
+        other_names = {file for file, _ in other_files}
+
+        changes.append(
+            PackageChange(
+                name,
+                str(a["version"]) if a is not None else None,
+                str(b["version"]) if b is not None else None,
+                sorted(other_names - names),
+                sorted(names - other_names),
+                sorted(
+                    {file for file, _ in files ^ other_files} & names & other_names
+                ),
+            )
+        )
+
+    return changes
+
+
+def format_change(change: PackageChange) -> str:
+    """Format a package change as a line of text.
+
+    Args:
+        change: The package change.
+
+    Returns:
+        A line of the form ``~ click 7.0 -> 7.1 (+2 -2 *0 files)``, where
+        ``*`` counts the files whose hashes changed.
+    """
+    if change.status == "added":
+        line = "+ {} {}".format(change.name, change.theirs)
+    elif change.status == "removed":
+        line = "- {} {}".format(change.name, change.ours)
+    elif change.ours != change.theirs:
+        line = "~ {} {} -> {}".format(change.name, change.ours, change.theirs)
+    else:
+        line = "~ {} {}".format(change.name, change.ours)
+
+    if change.files_added or change.files_removed or change.files_changed:
+        line += " (+{} -{} *{} files)".format(
+            len(change.files_added),
+            len(change.files_removed),
+            len(change.files_changed),
+        )
+
+    return line
+
+
+def format_text(changes: List[PackageChange]) -> str:
+    """Format package changes as text, one package per line.
+
+    Args:
+        changes: The package changes.
+
+    Returns:
+        The formatted text.
+    """
+    return "\n".join(format_change(change) for change in changes)
+
+
+def format_json(changes: List[PackageChange]) -> str:
+    """Format package changes as JSON.
+
+    Args:
+        changes: The package changes.
+
+    Returns:
+        A JSON array with an object for every package.
+    """
+    data: List[Dict[str, Any]] = [
+        dict(change._asdict(), status=change.status) for change in changes
+    ]
+    return json.dumps(data, indent=2)
@@ -1,14 +1,23 @@
 """Merge tool for Poetry lock files at the TOML level."""
 import itertools
+from enum import Enum
+from typing import AbstractSet
 from typing import Any
 from typing import Dict
 from typing import List
+from typing import Mapping
+from typing import Optional
+from typing import Set
 
 import tomlkit
+from poetry.semver import Version
 from tomlkit.api import _TOMLDocument
+from tomlkit.api import Array
 from tomlkit.api import Key
 from tomlkit.api import Table
 
+from .store import FileStore
+
 
 class MergeConflictError(ValueError):
     """An item in the TOML document cannot be merged."""
@@ -21,12 +30,78 @@ class MergeConflictError(ValueError):
         super().__init__(message)
 
 
-def merge_locked_packages(value: List[Table], other: List[Table]) -> List[Table]:
+class Preference(Enum):
+    """Policy for resolving conflicts between versions of a locked package."""
+
+    OURS = "ours"
+    THEIRS = "theirs"
+    NEWEST = "newest"
+
+
+def index_packages(packages: List[Table]) -> Dict[str, Table]:
+    """Index a TOML array containing locked packages by package name.
+
+    Args:
+        packages: The locked packages.
+
+    Returns:
+        A dictionary mapping package names to packages.
+    """
+    return {package["name"]: package for package in packages}
+
+
+def find_package_conflicts(value: List[Table], other: List[Table]) -> Set[str]:
+    """Find the packages which differ between two TOML arrays of locked packages.
+
+    Args:
+        value: The packages in *our* version of the lock file.
+        other: The packages in *their* version of the lock file.
+
+    Returns:
+        The names of packages whose entries differ between both versions.
+    """
+    ours = index_packages(value)
+    theirs = index_packages(other)
+
+    return {
+        name
+        for name in ours.keys() & theirs.keys()
+        if ours[name].value != theirs[name].value
+    }
+
+
+def prefer_locked_package(ours: Table, theirs: Table, prefer: Preference) -> Table:
+    """Select one of two conflicting versions of a locked package.
+
+    Args:
+        ours: The package in *our* version of the lock file.
+        theirs: The package in *their* version of the lock file.
+        prefer: The policy for selecting the package.
+
+    Returns:
+        The selected package.
+    """
+    if prefer is Preference.OURS:
+        return ours
+
+    if prefer is Preference.THEIRS:
+        return theirs
+
+    if Version.parse(theirs["version"]) > Version.parse(ours["version"]):
+        return theirs
+
+    return ours
+
+
+def merge_locked_packages(
+    value: List[Table], other: List[Table], prefer: Optional[Preference] = None
+) -> List[Table]:
     """Merge two TOML arrays containing locked packages.
 
     Args:
         value: The packages in *our* version of the lock file.
         other: The packages in *their* version of the lock file.
+        prefer: The policy for resolving conflicts, if any.
 
     Returns:
         The packages obtained from merging both versions.
@@ -39,17 +114,48 @@ def merge_locked_packages(value: List[Table], other: List[Table]) -> List[Table]
     for package in itertools.chain(value, other):
         current = packages.setdefault(package["name"], package)
         if package.value != current.value:
-            raise MergeConflictError(["package"], current, package)
+            if prefer is None:
+                raise MergeConflictError(["package"], current, package)
+            packages[package["name"]] = prefer_locked_package(current, package, prefer)
 
     return list(packages.values())
 
 
-def merge_locked_package_files(value: Table, other: Table) -> Table:
+def merge_files(value: Array, other: Array) -> Array:
+    """Merge two TOML arrays containing the files of a package.
+
+    Args:
+        value: The files in *our* version of the lock file.
+        other: The files in *their* version of the lock file.
+
+    Returns:
+        The files contained in either version.
+    """
+    files = tomlkit.array()
+
+    for file in itertools.chain(value, [file for file in other if file not in value]):
+        entry = tomlkit.inline_table()
+        entry.update(file)
+        files.append(entry)
+
+    return files
+
+
+def merge_locked_package_files(
+    value: Table,
+    other: Table,
+    prefer: Optional[Mapping[str, Preference]] = None,
+    verified: AbstractSet[str] = frozenset(),
+) -> Table:
     """Merge two TOML tables containing package files.
 
     Args:
         value: The package files in *our* version of the lock file.
         other: The package files in *their* version of the lock file.
+        prefer: The version whose files are used in a conflict, keyed by
+            package name. Values are either ``OURS`` or ``THEIRS``.
+        verified: The packages whose files are merged in a conflict, because
+            every file of both versions was recorded in earlier merges.
 
     Returns:
         The package files obtained from merging both versions.
@@ -63,13 +169,75 @@ def merge_locked_package_files(value: Table, other: Table) -> Table:
         a = value.get(key)
         b = other.get(key)
         if None not in (a, b) and a != b:
-            raise MergeConflictError(["metadata", "files", key], a, b)
+            if prefer is not None and key in prefer:
+                if prefer[key] is Preference.THEIRS:
+                    a = None
+            elif key in verified:
+                a = merge_files(a, b)
+            else:
+                raise MergeConflictError(["metadata", "files", key], a, b)
         files[key] = a if a is not None else b
 
     return files
 
 
-def merge(value: _TOMLDocument, other: _TOMLDocument) -> _TOMLDocument:
+def find_stored_package_files(
+    value: Table, other: Table, packages: List[Table], store: FileStore
+) -> Set[str]:
+    """Find the conflicting package files which were recorded in the store.
+
+    Args:
+        value: The package files in *our* version of the lock file.
+        other: The package files in *their* version of the lock file.
+        packages: The merged packages.
+        store: The store of package files from earlier merges.
+
+    Returns:
+        The names of packages whose files differ between both versions, and
+        whose files in either version are all recorded for the package version.
+    """
+    result = set()
+
+    for package in packages:
+        name = package["name"]
+        a = value.get(name)
+        b = other.get(name)
+        if a is None or b is None or a == b:
+            continue
+
+        files = store.get(name, package["version"])
+        if files is not None and all(file in files for file in itertools.chain(a, b)):
+            result.add(name)
+
+    return result
+
+
+def add_package_files(
+    lock_data: _TOMLDocument, store: FileStore, exclude: AbstractSet[str] = frozenset()
+) -> None:
+    """Record the package files of merged lock data in the store.
+
+    Call this function only after the merged lock data has been checked, so
+    that the store does not record files from inconsistent lock data.
+
+    Args:
+        lock_data: The merged lock data.
+        store: The store of package files from earlier merges.
+        exclude: The names of packages whose files are not recorded.
+    """
+    for package in lock_data["package"]:
+        name = package["name"]
+        if name not in exclude:
+            files = lock_data["metadata"]["files"].get(name, [])
+            store.add(name, package["version"], files)
+
+
+def merge(
+    value: _TOMLDocument,
+    other: _TOMLDocument,
+    prefer: Optional[Preference] = None,
+    store: Optional[FileStore] = None,
+) -> _TOMLDocument:
     """Merge two versions of lock data.
 
     This function returns a TOML document with the following merged entries:
@@ -80,19 +248,78 @@ def merge(value: _TOMLDocument, other: _TOMLDocument) -> _TOMLDocument:
     Any other entries, e.g. ``metadata.content-hash``, are omitted. They are
     generated from pyproject.toml when the lock data is written to disk.
 
+    If a policy is passed for resolving conflicts, conflicting packages are
+    taken from the preferred version of the lock data, together with their
+    entries in ``metadata.files``. The policy does not apply to packages which
+    only differ in their entries in ``metadata.files``.
+
+    If a store is passed with ``merge_files`` enabled, conflicting entries in
+    ``metadata.files`` are merged if every file in both versions was recorded
+    for the same package version in earlier merges. No entries are added to
+    the store, but reading an entry updates its modification time.
+
     Args:
         value: Our version of the lock data.
         other: Their version of the lock data.
+        prefer: The policy for resolving conflicts, if any.
+        store: The store of package files from earlier merges, if any.
 
     Returns:
         The merged lock data.
     """
+    packages = merge_locked_packages(value["package"], other["package"], prefer)
+    conflicts = find_package_conflicts(value["package"], other["package"])
+    ours = index_packages(value["package"])
+    sources = {
+        package["name"]: (
+            Preference.OURS
+            if package is ours.get(package["name"])
+            else Preference.THEIRS
+        )
+        for package in packages
+        if package["name"] in conflicts
+    }
+
+    verified = (
+        find_stored_package_files(
+            value["metadata"]["files"],
+            other["metadata"]["files"],
+            [package for package in packages if package["name"] not in conflicts],
+            store,
+        )
+        if store is not None and store.merge_files
+        else set()
+    )
+
     document = tomlkit.document()
-    document["package"] = merge_locked_packages(value["package"], other["package"])
+    document["package"] = packages
     document["metadata"] = {
         "files": merge_locked_package_files(
-            value["metadata"]["files"], other["metadata"]["files"]
+            value["metadata"]["files"], other["metadata"]["files"], sources, verified
         )
     }
 
     return document
+
+
+def find_conflicts(value: _TOMLDocument, other: _TOMLDocument) -> Set[str]:
+    """Find the packages with conflicting entries in two versions of lock data.
+
+    Args:
+        value: Our version of the lock data.
+        other: Their version of the lock data.
+
+    Returns:
+        The names of packages whose entries in ``package`` or ``metadata.files``
+        differ between both versions.
+    """
+    ours = index_packages(value["package"])
+    theirs = index_packages(other["package"])
+    our_files = value["metadata"]["files"]
+    their_files = other["metadata"]["files"]
+
+    return find_package_conflicts(value["package"], other["package"]) | {
+        name
+        for name in ours.keys() & theirs.keys()
+        if our_files.get(name) != their_files.get(name)
+    }
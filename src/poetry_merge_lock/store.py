@@ -0,0 +1,154 @@
+"""Store for the files of locked packages, shared across projects."""
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+
+from poetry.utils._compat import Path
+
+
+def digest(text: str) -> str:
+    """Return the SHA-256 digest of a string.
+
+    Args:
+        text: The string.
+
+    Returns:
+        The hexadecimal digest.
+    """
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class FileStore:
+    """Store for the files of locked packages.
+
+    The store holds the ``metadata.files`` entries of packages which were
+    merged successfully, keyed by package name and version. Every package
+    version has a directory named after the digest of its key. Every list of
+    files recorded for the package version is a JSON file in that directory,
+    named after the digest of its contents. Entries are never modified once
+    written, so concurrent merges do not lose each other's updates. The
+    modification time of an entry is updated whenever it is used, so that
+    pruning removes the least recently used entries first.
+
+    Attributes:
+        directory: The directory containing the store.
+        merge_files: Merge conflicting package files if every file in both
+            versions was recorded for the package version. This can restore a
+            file or hash which one version removed deliberately, so it is
+            disabled by default.
+    """
+
+    def __init__(self, directory: Path, merge_files: bool = False) -> None:
+        """Constructor."""
+        self.directory = directory
+        self.merge_files = merge_files
+
+    def path(self, name: str, version: str, files: List[Dict[str, str]]) -> Path:
+        """Return the path of the entry for a list of package files.
+
+        Args:
+            name: The package name.
+            version: The package version.
+            files: The files of the package.
+
+        Returns:
+            The path to the entry.
+        """
+        key = digest("{}=={}".format(name, version))
+        return self.directory / key / "{}.json".format(digest(json.dumps(files)))
+
+    def get(self, name: str, version: str) -> Optional[List[Dict[str, str]]]:
+        """Retrieve the files of a package.
+
+        Args:
+            name: The package name.
+            version: The package version.
+
+        Returns:
+            The files recorded for the package, or None if the package is not in
+            the store.
+        """
+        directory = self.directory / digest("{}=={}".format(name, version))
+        files: List[Dict[str, str]] = []
+
+        for path in sorted(directory.glob("*.json")):
+            try:
+                with path.open() as io:
+                    entries: List[Dict[str, str]] = json.load(io)
+                os.utime(path)
+            except FileNotFoundError:  # removed by a concurrent prune
+                continue
+
+            files.extend(entry for entry in entries if entry not in files)
+
+        return sorted(files, key=lambda file: sorted(file.items())) or None
+
+    def add(self, name: str, version: str, files: Iterable[Dict[str, Any]]) -> None:
+        """Record the files of a package.
+
+        Nothing is written if the same list of files was recorded before, or if
+        the list is empty.
+
+        Args:
+            name: The package name.
+            version: The package version.
+            files: The files of the package.
+        """
+        data = sorted(
+            ({str(key): str(value) for key, value in file.items()} for file in files),
+            key=lambda file: sorted(file.items()),
+        )
+        if not data:
+            return
+
+        path = self.path(name, version, data)
+        if path.exists():
+            return
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        with tempfile.NamedTemporaryFile(
+            "w", dir=str(path.parent), suffix=".tmp", delete=False
+        ) as io:
+            json.dump(data, io)
+
+        os.replace(io.name, str(path))
+
+    def prune(self, max_size: int) -> int:
+        """Remove the least recently used entries until the store is small enough.
+
+        Args:
+            max_size: The maximum total size of the entries, in bytes.
+
+        Returns:
+            The number of removed entries.
+        """
+        entries = []
+
+        for path in self.directory.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # removed by a concurrent prune
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort(reverse=True)
+        size = 0
+        removed = 0
+
+        for _, entry_size, path in entries:
+            size += entry_size
+            if size > max_size:
+                try:
+                    path.unlink()
+                except FileNotFoundError:  # removed by a concurrent prune
+                    continue
+                removed += 1
+
+        return removed
@@ -0,0 +1,152 @@
+"""Watch the lock file and resolve merge conflicts as they appear."""
+import subprocess  # noqa: S404
+import time
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+
+from poetry.factory import Factory
+from poetry.poetry import Poetry
+from poetry.utils._compat import Path
+
+from . import parser
+from .core import merge_lock
+from .mergetool import Preference
+from .store import FileStore
+
+
+def stat(path: Path) -> Optional[Tuple[int, int]]:
+    """Return the modification time and size of a file.
+
+    Args:
+        path: The path to the file.
+
+    Returns:
+        A pair of modification time in nanoseconds and size in bytes, or None
+        if the file does not exist.
+    """
+    try:
+        result = path.stat()
+    except FileNotFoundError:
+        return None
+
+    return result.st_mtime_ns, result.st_size
+
+
+def has_conflicts(path: Path) -> bool:
+    """Return True if the file contains conflict markers.
+
+    Args:
+        path: The path to the file.
+
+    Returns:
+        True if a line in the file starts a merge conflict.
+    """
+    with path.open() as io:
+        return any(parser.tokenize(line) is parser.Token.CONFLICT_START for line in io)
+
+
+def stage(path: Path) -> None:
+    """Stage a file using git.
+
+    Args:
+        path: The path to the file.
+    """
+    subprocess.run(  # noqa: S603,S607
+        ["git", "add", "--", path.name], cwd=str(path.parent), check=True
+    )
+
+
+class Watcher:
+    """Resolve merge conflicts in the lock file whenever they appear.
+
+    The Poetry project is loaded when the watcher is created, and only reloaded
+    when pyproject.toml changes, so that resolving conflicts does not incur the
+    startup cost.
+
+    Attributes:
+        directory: The project directory.
+        prefer: The policy for resolving conflicting package versions, if any.
+        store: The store of package files from earlier merges, if any.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        prefer: Optional[Preference] = None,
+        store: Optional[FileStore] = None,
+    ) -> None:
+        """Constructor."""
+        self.directory = directory
+        self.prefer = prefer
+        self.store = store
+        self._pyproject = stat(directory / "pyproject.toml")
+        self._poetry = Factory().create_poetry(directory)
+        self._lock: Optional[Tuple[int, int]] = None
+
+    @property
+    def poetry(self) -> Poetry:
+        """Return the Poetry project, reloading it if pyproject.toml changed."""
+        pyproject = stat(self.directory / "pyproject.toml")
+
+        if pyproject != self._pyproject:
+            self._poetry = Factory().create_poetry(self.directory)
+            self._pyproject = pyproject
+
+        return self._poetry
+
+    def poll(self) -> bool:
+        """Check the lock file once, and resolve merge conflicts if present.
+
+        The lock file is only read if it was modified since the last check.
+        After resolving the conflicts, the lock file is staged using git.
+
+        Returns:
+            True if merge conflicts were resolved.
+        """
+        path = self.directory / "poetry.lock"
+        lock = stat(path)
+
+        if lock is None or lock == self._lock:
+            return False
+
+        self._lock = lock
+
+        if not has_conflicts(path):
+            return False
+
+        merge_lock(self.poetry, self.prefer, self.store)
+        stage(path)
+        self._lock = stat(path)
+        return True
+
+
+def watch(
+    watcher: Watcher, interval: float, polls: Optional[int] = None
+) -> Iterator[Optional[Exception]]:
+    """Poll the lock file, resolving merge conflicts as they appear.
+
+    Errors are reported without stopping, so the conflicts can be resolved
+    manually while the watcher keeps running.
+
+    Args:
+        watcher: The watcher for the lock file.
+        interval: The number of seconds between polls.
+        polls: The number of polls, or None to poll forever.
+
+    Yields:
+        None whenever merge conflicts were resolved, or the exception if they
+        could not be resolved.
+    """
+    count = 0
+
+    while polls is None or count < polls:
+        try:
+            if watcher.poll():
+                yield None
+        except Exception as error:
+            yield error
+
+        count += 1
+        if polls is None or count < polls:
+            time.sleep(interval)
@@ -0,0 +1,511 @@
+"""Tests for the core module."""
+import concurrent.futures
+import sys
+import textwrap
+import threading
+from pathlib import Path
+from typing import AbstractSet
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import pytest
+import tomlkit
+from poetry.factory import Factory
+from poetry.packages import Package
+from poetry.packages import ProjectPackage
+from poetry.packages.locker import Locker
+from poetry.poetry import Poetry
+from poetry.repositories import Pool
+from poetry.repositories import Repository
+from tomlkit.api import _TOMLDocument
+
+from poetry_merge_lock import core
+from poetry_merge_lock import mergetool
+from poetry_merge_lock.store import FileStore
+
+
+@pytest.fixture
+def root() -> Package:
+    """Root package depending on click 7."""
+    package = ProjectPackage("root", "1.0.0")
+    package.add_dependency("click", "^7.0")
+    return package
+
+
+def test_check_dependencies_succeeds(root: Package) -> None:
+    """It accepts locked packages that satisfy the constraints."""
+    core.check_dependencies(root, [Package("click", "7.0")])
+
+
+def test_check_dependencies_fails_for_root(root: Package) -> None:
+    """It rejects locked packages that violate constraints in pyproject.toml."""
+    with pytest.raises(core.UnsatisfiedDependencyError, match="click"):
+        core.check_dependencies(root, [Package("click", "6.0")])
+
+
+def test_check_dependencies_fails_for_package(root: Package) -> None:
+    """It rejects locked packages that violate constraints of other packages."""
+    package = Package("black", "19.10b0")
+    package.add_dependency("click", ">=7.1")
+    with pytest.raises(core.UnsatisfiedDependencyError, match="click"):
+        core.check_dependencies(root, [Package("click", "7.0"), package])
+
+
+@pytest.fixture
+def package_with_extra() -> Package:
+    """Package with an optional dependency on click 6, under the extra ``x``."""
+    package = Package("a", "1.0")
+    dependency = package.add_dependency("click", {"version": "<7", "optional": True})
+    package.extras["x"] = [dependency]
+    return package
+
+
+def test_check_dependencies_ignores_optional_dependencies(
+    root: Package, package_with_extra: Package
+) -> None:
+    """It ignores optional dependencies if their extra is not requested."""
+    core.check_dependencies(root, [Package("click", "7.0"), package_with_extra])
+
+
+def test_check_dependencies_fails_for_requested_extra(
+    root: Package, package_with_extra: Package
+) -> None:
+    """It rejects locked packages that violate constraints of requested extras."""
+    root.add_dependency("a", {"version": "*", "extras": ["x"]})
+    with pytest.raises(core.UnsatisfiedDependencyError, match="click"):
+        core.check_dependencies(root, [Package("click", "7.0"), package_with_extra])
+
+
+def test_find_dependents() -> None:
+    """It finds direct and indirect dependents of a package."""
+    black = Package("black", "19.10b0")
+    black.add_dependency("click", "^7.0")
+    nox = Package("nox", "2020.8.22")
+    nox.add_dependency("black", "*")
+    packages = [Package("click", "7.0"), black, nox, Package("attrs", "20.2.0")]
+    assert core.find_dependents(packages, {"click"}) == {"click", "black", "nox"}
+
+
+def test_resolve_keeps_other_packages_pinned(root: Package) -> None:
+    """It resolves the given packages without changing other packages."""
+    root.add_dependency("attrs", "*")
+    packages = [Package("click", "7.0"), Package("attrs", "19.3.0")]
+    candidates = [Package("click", "7.1"), Package("attrs", "20.2.0")]
+    result = core.resolve(root, Pool(), packages, candidates, {"click"})
+    versions = {package.name: package.version.text for package in result}
+    assert versions == {"click": "7.1", "attrs": "19.3.0"}
+
+
+@pytest.fixture
+def remote() -> Pool:
+    """Pool with a repository containing newer versions."""
+    black = Package("black", "22.1.0")
+    black.add_dependency("click", ">=8.0")
+    packages = [Package("click", "7.1.2"), Package("click", "8.0"), black]
+    return Pool([Repository(packages)])
+
+
+def test_resolve_prefers_locked_versions(root: Package, remote: Pool) -> None:
+    """It does not use newer versions from the pool if the candidates fit."""
+    root.add_dependency("black", "*")
+    black = Package("black", "19.10b0")
+    black.add_dependency("click", ">=6.5")
+    packages = [Package("click", "7.0"), black]
+    candidates = [Package("click", "7.1")]
+    result = core.resolve(root, remote, packages, candidates, {"click"})
+    versions = {package.name: package.version.text for package in result}
+    assert versions == {"click": "7.1", "black": "19.10b0"}
+
+
+def test_resolve_falls_back_to_pool(root: Package, remote: Pool) -> None:
+    """It uses the pool if the candidates do not fit."""
+    root.add_dependency("click", ">=7.1.1")
+    packages = [Package("click", "7.0")]
+    candidates = [Package("click", "7.1")]
+    [click] = core.resolve(root, remote, packages, candidates, {"click"})
+    assert click.version.text == "7.1.2"
+
+
+def test_resolve_keeps_files(root: Package) -> None:
+    """It keeps the files of locked packages and candidates."""
+    root.add_dependency("attrs", "*")
+    packages = [Package("click", "7.0"), Package("attrs", "19.3.0")]
+    candidates = [Package("click", "7.1")]
+    for package in packages + candidates:
+        package.files = [{"file": f"{package.unique_name}.whl", "hash": "sha256:0"}]
+    result = core.resolve(root, Pool(), packages, candidates, {"click"})
+    files = {package.name: package.files for package in result}
+    assert files == {
+        "click": [{"file": "click-7.1.whl", "hash": "sha256:0"}],
+        "attrs": [{"file": "attrs-19.3.0.whl", "hash": "sha256:0"}],
+    }
+
+
+def test_resolve_merges_files(root: Package) -> None:
+    """It merges the files of packages with the same name and version."""
+    packages = [Package("click", "7.0")]
+    candidates = [Package("click", "7.0")]
+    packages[0].files = [{"file": "click-7.0.tar.gz", "hash": "sha256:0"}]
+    candidates[0].files = [{"file": "click-7.0.tar.gz", "hash": "sha256:1"}]
+    [click] = core.resolve(root, Pool(), packages, candidates, set())
+    assert click.files == packages[0].files + candidates[0].files
+
+
+PYPROJECT = """\
+[tool.poetry]
+name = "example"
+version = "0.1.0"
+description = ""
+authors = []
+
+[tool.poetry.dependencies]
+python = "^3.7"
+attrs = "*"
+click = "^7.0"
+"""
+
+LOCK = """\
+[[package]]
+category = "main"
+description = "Classes Without Boilerplate"
+name = "attrs"
+optional = false
+python-versions = "*"
+version = "19.3.0"
+
+<<<<<<< HEAD
+[[package]]
+category = "main"
+description = "Composable command line interface toolkit"
+name = "click"
+optional = false
+python-versions = "*"
+version = "7.0"
+=======
+[[package]]
+category = "main"
+description = "Composable command line interface toolkit"
+name = "click"
+optional = false
+python-versions = "*"
+version = "7.1"
+>>>>>>> Upgrade click
+
+[metadata]
+content-hash = "0000000000000000000000000000000000000000000000000000000000000000"
+python-versions = "^3.7"
+
+[metadata.files]
+attrs = [
+    {file = "attrs-19.3.0.tar.gz", hash = "sha256:0000"},
+]
+<<<<<<< HEAD
+click = [
+    {file = "click-7.0.tar.gz", hash = "sha256:7000"},
+]
+=======
+click = [
+    {file = "click-7.1.tar.gz", hash = "sha256:7100"},
+]
+>>>>>>> Upgrade click
+"""
+
+
+def test_merge_lock_text() -> None:
+    """It merges the lock file contents in memory."""
+    text = core.merge_lock_text(
+        LOCK.encode(), PYPROJECT.encode(), mergetool.Preference.NEWEST
+    )
+    lock_data = tomlkit.loads(text)
+    versions = {package["name"]: package["version"] for package in lock_data["package"]}
+    assert versions == {"attrs": "19.3.0", "click": "7.1"}
+    assert lock_data["metadata"]["content-hash"] != "0" * 64
+
+
+def test_merge_lock_text_with_path_dependency(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """It does not access the filesystem for path dependencies."""
+    monkeypatch.chdir(tmp_path)
+    pyproject = PYPROJECT + 'mylib = {path = "../mylib"}\n'
+    lock = LOCK.replace(
+        "<<<<<<< HEAD",
+        textwrap.dedent(
+            """\
+            [[package]]
+            category = "main"
+            description = ""
+            name = "mylib"
+            optional = false
+            python-versions = "*"
+            version = "0.1.0"
+
+            [package.source]
+            reference = ""
+            type = "directory"
+            url = "../mylib"
+
+            <<<<<<< HEAD"""
+        ),
+        1,
+    ).replace("[metadata.files]\n", "[metadata.files]\nmylib = []\n")
+    text = core.merge_lock_text(lock, pyproject, mergetool.Preference.NEWEST)
+    lock_data = tomlkit.loads(text)
+    [_, _, mylib] = lock_data["package"]
+    assert mylib["source"]["url"] == "../mylib"
+
+
+def test_merge_lock_text_with_unused_extra() -> None:
+    """It accepts optional dependencies which conflict with unused extras."""
+    pyproject = PYPROJECT + 'a = "*"\n'
+    lock = LOCK.replace(
+        "<<<<<<< HEAD",
+        textwrap.dedent(
+            """\
+            [[package]]
+            category = "main"
+            description = ""
+            name = "a"
+            optional = false
+            python-versions = "*"
+            version = "1.0"
+
+            [package.dependencies]
+            click = {version = "<7", optional = true}
+
+            [package.extras]
+            x = ["click (<7)"]
+
+            <<<<<<< HEAD"""
+        ),
+        1,
+    ).replace("[metadata.files]\n", "[metadata.files]\na = []\n")
+    text = core.merge_lock_text(lock, pyproject, mergetool.Preference.NEWEST)
+    lock_data = tomlkit.loads(text)
+    assert [package["name"] for package in lock_data["package"]] == [
+        "a",
+        "attrs",
+        "click",
+    ]
+
+
+def test_merge_lock_text_fails_on_conflict() -> None:
+    """It does not invoke the solver if conflicts remain."""
+    with pytest.raises(mergetool.MergeConflictError):
+        core.merge_lock_text(LOCK, PYPROJECT)
+
+
+class ThreadLocalLockFile(threading.local):
+    """Lock file which keeps separate contents in memory for every thread."""
+
+    data: Optional[_TOMLDocument] = None
+
+    def exists(self) -> bool:
+        """Return True if the current thread has written the lock file."""
+        return self.data is not None
+
+    def read(self) -> Optional[_TOMLDocument]:
+        """Return the lock data written by the current thread."""
+        return self.data
+
+    def write(self, data: _TOMLDocument) -> None:
+        """Replace the lock data of the current thread."""
+        self.data = data
+
+
+class ThreadLocalLocker(Locker):  # type: ignore[misc]
+    """Locker whose lock file keeps separate contents for every thread."""
+
+    def __init__(self, path: Path, local_config: Dict[str, Any]) -> None:
+        """Constructor."""
+        super().__init__(path, local_config)
+        self._thread_local_lock = ThreadLocalLockFile()
+
+    @property
+    def lock(self) -> ThreadLocalLockFile:
+        """Return the lock file of the current thread."""
+        return self._thread_local_lock
+
+
+@pytest.fixture
+def frequent_thread_switches() -> Iterator[None]:
+    """Switch between threads as often as possible, to provoke races."""
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+@pytest.mark.usefixtures("frequent_thread_switches")
+def test_merges_are_thread_safe(root: Package, tmp_path: Path) -> None:
+    """Concurrent merges with a shared locker produce the same results as serial merges."""
+    path = tmp_path / "poetry.lock"
+    path.write_text(core.merge_lock_text(LOCK, PYPROJECT, mergetool.Preference.OURS))
+    locker = ThreadLocalLocker(path, {})
+
+    def merge(lock: str, prefer: mergetool.Preference) -> Tuple[str, str]:
+        ours, theirs = core.parse_toml_versions(lock.splitlines(keepends=True))
+        core.save(locker, mergetool.merge(ours, theirs, prefer), root)
+        return (
+            tomlkit.dumps(locker.lock.read()),
+            core.merge_lock_text(lock, PYPROJECT, prefer),
+        )
+
+    jobs = [
+        (LOCK.replace("7.1", "7.{}".format(index % 10 + 1)), prefer)
+        for index in range(50)
+        for prefer in mergetool.Preference
+    ]
+    expected = [merge(lock, prefer) for lock, prefer in jobs]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+        futures = [executor.submit(merge, lock, prefer) for lock, prefer in jobs]
+        results = [future.result() for future in futures]
+
+    assert results == expected
+
+
+@pytest.fixture
+def poetry(tmp_path: Path) -> Poetry:
+    """Poetry project with merge conflicts in the lock file."""
+    (tmp_path / "pyproject.toml").write_text(PYPROJECT)
+    (tmp_path / "poetry.lock").write_text(LOCK)
+    return Factory().create_poetry(tmp_path)
+
+
+def test_write_fails_on_inconsistent_lock_file(
+    poetry: Poetry, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """It checks that the lock file was written correctly."""
+    monkeypatch.setattr(poetry.locker.lock, "read", tomlkit.document)
+    with pytest.raises(RuntimeError, match="Inconsistent"):
+        core.write(poetry.locker, poetry.package, [])
+
+
+@pytest.fixture
+def resolve_calls(monkeypatch: pytest.MonkeyPatch) -> List[AbstractSet[str]]:
+    """Replace the solver, recording the names of the packages to resolve."""
+    calls: List[AbstractSet[str]] = []
+
+    def resolve(
+        root: Package,
+        pool: Pool,
+        packages: List[Package],
+        candidates: List[Package],
+        names: AbstractSet[str],
+    ) -> List[Package]:
+        calls.append(names)
+        return packages
+
+    monkeypatch.setattr(core, "resolve", resolve)
+    return calls
+
+
+def test_merge_lock_resolves_conflicts(
+    poetry: Poetry, resolve_calls: List[AbstractSet[str]]
+) -> None:
+    """It passes only the conflicting packages to the solver."""
+    core.merge_lock(poetry)
+
+    assert resolve_calls == [{"click"}]
+    assert "<<<<<<<" not in poetry.locker.lock.read_text()
+
+
+@pytest.mark.parametrize("prefer", [None, mergetool.Preference.THEIRS])
+def test_merge_lock_merges_files_of_same_version(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    prefer: Optional[mergetool.Preference],
+) -> None:
+    """It keeps the files of both versions if only the files conflict."""
+    (tmp_path / "pyproject.toml").write_text(PYPROJECT)
+    (tmp_path / "poetry.lock").write_text(LOCK.replace('"7.1"', '"7.0"'))
+    poetry = Factory().create_poetry(tmp_path)
+    monkeypatch.setattr(poetry, "_pool", Pool())
+    core.merge_lock(poetry, prefer)
+
+    lock_data = tomlkit.loads(poetry.locker.lock.read_text())
+    hashes = [entry["hash"] for entry in lock_data["metadata"]["files"]["click"]]
+    assert hashes == ["sha256:7000", "sha256:7100"]
+
+
+def test_merge_lock_resolves_unsatisfied_dependencies(
+    poetry: Poetry,
+    resolve_calls: List[AbstractSet[str]],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """It passes packages violating a constraint to the solver."""
+    root = ProjectPackage("example", "0.1.0")
+    root.add_dependency("attrs", ">=20.1")
+    monkeypatch.setattr(poetry, "_package", root)
+    core.merge_lock(poetry, mergetool.Preference.NEWEST)
+
+    assert resolve_calls == [{"attrs", "click"}]
+
+
+def test_merge_lock_adds_files_to_store(poetry: Poetry, tmp_path: Path) -> None:
+    """It records the files of packages without conflicts."""
+    store = FileStore(tmp_path / "store")
+    core.merge_lock(poetry, mergetool.Preference.NEWEST, store)
+
+    assert store.get("attrs", "19.3.0") == [
+        {"file": "attrs-19.3.0.tar.gz", "hash": "sha256:0000"}
+    ]
+    assert store.get("click", "7.1") is None
+
+
+def test_merge_lock_does_not_add_files_on_failure(
+    poetry: Poetry,
+    tmp_path: Path,
+    resolve_calls: List[AbstractSet[str]],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """It does not record files if the merged lock file is inconsistent."""
+    root = ProjectPackage("example", "0.1.0")
+    root.add_dependency("attrs", ">=20.1")
+    monkeypatch.setattr(poetry, "_package", root)
+    store = FileStore(tmp_path / "store")
+    core.merge_lock(poetry, mergetool.Preference.NEWEST, store)
+
+    assert store.get("attrs", "19.3.0") is None
+
+
+def test_create_package() -> None:
+    """It loads dependencies, development dependencies, and extras."""
+    local_config = tomlkit.loads(
+        PYPROJECT
+        + textwrap.dedent(
+            """\
+            toml = [
+                {version = "^0.10", python = "^3.7"},
+                {version = "^0.9", python = "<3.7"},
+            ]
+            mylib = {path = "../mylib", develop = true, optional = true}
+
+            [tool.poetry.dev-dependencies]
+            pytest = "^6.0"
+
+            [tool.poetry.extras]
+            cli = ["click"]
+            """
+        )
+    )["tool"]["poetry"]
+    package = core.create_package(local_config)
+    [click] = package.extras["cli"]
+    [dev_dependency] = package.dev_requires
+
+    assert str(package.python_constraint) == ">=3.7,<4.0"
+    assert [dependency.name for dependency in package.requires] == [
+        "attrs",
+        "click",
+        "toml",
+        "toml",
+        "mylib",
+    ]
+    assert package.requires[-1].is_optional()
+    assert click.in_extras == ["cli"]
+    assert dev_dependency.category == "dev"
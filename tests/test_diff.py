@@ -0,0 +1,111 @@
+"""Tests for the diff module."""
+import json
+import textwrap
+from typing import List
+
+import pytest
+import tomlkit
+from tomlkit.api import _TOMLDocument
+
+from poetry_merge_lock import diff
+
+
+def create_lockfile(*packages: str) -> _TOMLDocument:
+    """Create lock data with packages given as ``name==version``."""
+    lines = []
+    files = []
+
+    for package in packages:
+        name, version = package.split("==")
+        lines.append(
+            textwrap.dedent(
+                """\
+                [[package]]
+                category = "main"
+                description = ""
+                name = "{name}"
+                optional = false
+                python-versions = "*"
+                version = "{version}"
+                """.format(
+                    name=name, version=version
+                )
+            )
+        )
+        files.append(
+            '{name} = [{{file = "{name}-{version}.tar.gz", hash = "sha256:0"}}]'.format(
+                name=name, version=version
+            )
+        )
+
+    lines.append("[metadata]\n")
+    lines.append('content-hash = "0"\n')
+    lines.append("[metadata.files]\n")
+    lines.extend("{}\n".format(line) for line in files)
+    return tomlkit.loads("\n".join(lines))
+
+
+@pytest.fixture
+def changes() -> List[diff.PackageChange]:
+    """Changes between two versions of lock data."""
+    ours = create_lockfile("attrs==19.3.0", "click==7.0", "six==1.15.0")
+    theirs = create_lockfile("click==7.1", "six==1.15.0", "toml==0.10.1")
+    return diff.diff(ours, theirs)
+
+
+def test_diff_lists_changed_packages(changes: List[diff.PackageChange]) -> None:
+    """Added, removed, and changed packages are listed, in order."""
+    assert [(change.name, change.status) for change in changes] == [
+        ("attrs", "removed"),
+        ("click", "changed"),
+        ("toml", "added"),
+    ]
+
+
+def test_diff_lists_changed_files(changes: List[diff.PackageChange]) -> None:
+    """Changes to package files are listed."""
+    change = changes[1]
+    assert change.files_added == ["click-7.1.tar.gz"]
+    assert change.files_removed == ["click-7.0.tar.gz"]
+
+
+def test_diff_lists_changed_files_without_version_change() -> None:
+    """Packages are listed if only their files changed."""
+    ours = create_lockfile("click==7.0")
+    theirs = create_lockfile("click==7.0")
+    theirs["metadata"]["files"]["click"] = tomlkit.array()
+    [change] = diff.diff(ours, theirs)
+    assert diff.format_change(change) == "~ click 7.0 (+0 -1 *0 files)"
+
+
+def test_diff_lists_changed_hashes() -> None:
+    """Files are listed if only their hashes changed."""
+    ours = create_lockfile("click==7.0")
+    theirs = create_lockfile("click==7.0")
+    theirs["metadata"]["files"]["click"][0]["hash"] = "sha256:1"
+    [change] = diff.diff(ours, theirs)
+    assert change.files_changed == ["click-7.0.tar.gz"]
+    assert diff.format_change(change) == "~ click 7.0 (+0 -0 *1 files)"
+
+
+def test_format_text(changes: List[diff.PackageChange]) -> None:
+    """Every package is formatted on a separate line."""
+    assert diff.format_text(changes).splitlines() == [
+        "- attrs 19.3.0 (+0 -1 *0 files)",
+        "~ click 7.0 -> 7.1 (+1 -1 *0 files)",
+        "+ toml 0.10.1 (+1 -0 *0 files)",
+    ]
+
+
+def test_format_json(changes: List[diff.PackageChange]) -> None:
+    """Every package is formatted as a JSON object."""
+    [_, click, _] = json.loads(diff.format_json(changes))
+    assert click == {
+        "name": "click",
+        "status": "changed",
+        "ours": "7.0",
+        "theirs": "7.1",
+        "files_added": ["click-7.1.tar.gz"],
+        "files_removed": ["click-7.0.tar.gz"],
+        "files_changed": [],
+    }
@@ -1,8 +1,16 @@
 """Test cases for the __main__ module."""
+import json
+import textwrap
+from pathlib import Path
+from typing import Any
+from typing import Iterator
+from typing import Optional
+
 import pytest
 from click.testing import CliRunner
 
 from poetry_merge_lock import __main__
+from poetry_merge_lock.store import FileStore
 
 
 @pytest.fixture
@@ -21,3 +29,83 @@ def test_main_succeeds_with_print_content_hash(runner: CliRunner) -> None:
     """It exits with a status code of zero."""
     result = runner.invoke(__main__.main, ["--print-content-hash"])
     assert result.exit_code == 0
+
+
+def test_main_fails_with_merge_stored_files_without_store(runner: CliRunner) -> None:
+    """It requires --store for --merge-stored-files."""
+    result = runner.invoke(__main__.main, ["--merge-stored-files"])
+    assert result.exit_code == 2
+
+
+@pytest.fixture
+def lock_file(tmp_path: Path) -> Path:
+    """Lock file with a merge conflict."""
+    lock_file = tmp_path / "poetry.lock"
+    lock_file.write_text(
+        textwrap.dedent(
+            """\
+            <<<<<<< HEAD
+            [[package]]
+            name = "click"
+            version = "7.0"
+            =======
+            [[package]]
+            name = "click"
+            version = "7.1"
+            >>>>>>> Upgrade click
+
+            [metadata]
+            content-hash = "0"
+
+            [metadata.files]
+            click = []
+            """
+        )
+    )
+    return lock_file
+
+
+def test_diff_succeeds(runner: CliRunner, lock_file: Path) -> None:
+    """It lists the packages changed by the merge conflict."""
+    result = runner.invoke(__main__.main, ["diff", str(lock_file)])
+    assert result.exit_code == 0
+    assert result.output == "~ click 7.0 -> 7.1\n"
+
+
+def test_diff_succeeds_with_json(runner: CliRunner, lock_file: Path) -> None:
+    """It lists the packages changed by the merge conflict as JSON."""
+    result = runner.invoke(__main__.main, ["diff", "--format=json", str(lock_file)])
+
+    assert result.exit_code == 0
+    assert json.loads(result.output)[0]["theirs"] == "7.1"
+
+
+def test_prune_store_succeeds(runner: CliRunner, tmp_path: Path) -> None:
+    """It removes entries from the store."""
+    FileStore(tmp_path).add("click", "7.0", [{"file": "click-7.0.tar.gz"}])
+    result = runner.invoke(
+        __main__.main, ["prune-store", "--max-size=0", str(tmp_path)]
+    )
+    assert result.exit_code == 0
+    assert result.output == "Removed 1 entries\n"
+
+
+def test_watch_succeeds(monkeypatch: pytest.MonkeyPatch) -> None:
+    """It reports resolved conflicts and errors."""
+
+    def watch_lock(*args: Any) -> Iterator[Optional[Exception]]:
+        yield None
+        yield ValueError("unterminated conflict marker")
+
+    monkeypatch.setattr(__main__, "watch_lock", watch_lock)
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(__main__.main, ["watch"])
+    assert result.exit_code == 0
+    assert result.stdout == "Resolved merge conflicts in poetry.lock\n"
+    assert "unterminated conflict marker" in result.stderr
+
+
+def test_watch_fails_with_zero_interval(runner: CliRunner) -> None:
+    """It rejects intervals which would result in a busy loop."""
+    result = runner.invoke(__main__.main, ["watch", "--interval=0"])
+    assert result.exit_code == 2
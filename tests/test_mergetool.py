@@ -1,11 +1,14 @@
 """Tests for the merge tool."""
 import textwrap
+from pathlib import Path
+from typing import Optional
 
 import pytest
 import tomlkit
 from tomlkit.api import _TOMLDocument
 
 from poetry_merge_lock import mergetool
+from poetry_merge_lock.store import FileStore
 
 
 @pytest.fixture
@@ -173,3 +176,185 @@ def test_merge_fails_on_inconsistent_files(
         match=r"Merge conflict at metadata\.files\.click, .*",
     ):
         mergetool.merge(value, other)
+
+
+@pytest.fixture
+def lockfile_with_click_and_other_files(
+    lockfile_with_click: _TOMLDocument, lockfile_with_click6: _TOMLDocument
+) -> _TOMLDocument:
+    """Lock file with click 7.0, but listing the files of click 6.0."""
+    # See test_merge_fails_on_inconsistent_files for why this is not deepcopy.
+    lockfile = lockfile_with_click.copy()
+    lockfile["metadata"] = lockfile_with_click["metadata"].copy()
+    lockfile["metadata"]["files"] = lockfile_with_click["metadata"]["files"].copy()
+    lockfile["metadata"]["files"]["click"] = lockfile_with_click6["metadata"][
+        "files"
+    ]["click"]
+    return lockfile
+
+
+@pytest.mark.parametrize("prefer", list(mergetool.Preference))
+def test_merge_with_preference_fails_on_inconsistent_files(
+    lockfile_with_click: _TOMLDocument,
+    lockfile_with_click_and_other_files: _TOMLDocument,
+    prefer: mergetool.Preference,
+) -> None:
+    """The policy does not apply if only the files of a package differ."""
+    with pytest.raises(
+        mergetool.MergeConflictError,
+        match=r"Merge conflict at metadata\.files\.click, .*",
+    ):
+        mergetool.merge(
+            lockfile_with_click, lockfile_with_click_and_other_files, prefer
+        )
+
+
+@pytest.mark.parametrize(
+    "prefer,version",
+    [
+        (mergetool.Preference.OURS, "7.0"),
+        (mergetool.Preference.THEIRS, "6.0"),
+        (mergetool.Preference.NEWEST, "7.0"),
+    ],
+)
+def test_merge_resolves_conflicts_with_preference(
+    lockfile_with_click: _TOMLDocument,
+    lockfile_with_click6: _TOMLDocument,
+    prefer: mergetool.Preference,
+    version: str,
+) -> None:
+    """Conflicting packages are taken from the preferred version."""
+    lockfile = mergetool.merge(lockfile_with_click, lockfile_with_click6, prefer)
+    [package] = lockfile["package"]
+    [file, _] = lockfile["metadata"]["files"]["click"]
+    assert package["version"] == version
+    assert version in file["file"]
+
+
+def test_merge_prefers_newest_from_their_version(
+    lockfile_with_click: _TOMLDocument, lockfile_with_click6: _TOMLDocument
+) -> None:
+    """The newest package is selected even if it is in their version."""
+    lockfile = mergetool.merge(
+        lockfile_with_click6, lockfile_with_click, mergetool.Preference.NEWEST
+    )
+    [package] = lockfile["package"]
+    assert package["version"] == "7.0"
+    assert "7.0" in lockfile["metadata"]["files"]["click"][0]["file"]
+
+
+def test_find_conflicts(
+    lockfile_with_attrs: _TOMLDocument,
+    lockfile_with_click: _TOMLDocument,
+    lockfile_with_click6: _TOMLDocument,
+) -> None:
+    """Packages are conflicting if they differ between both versions."""
+    value = mergetool.merge(lockfile_with_attrs, lockfile_with_click)
+    assert {"click"} == mergetool.find_conflicts(value, lockfile_with_click6)
+
+
+@pytest.mark.parametrize("prefer", [None, mergetool.Preference.THEIRS])
+@pytest.mark.parametrize("swap", [False, True])
+def test_merge_resolves_files_using_store(
+    lockfile_with_click: _TOMLDocument,
+    lockfile_with_click_and_other_files: _TOMLDocument,
+    tmp_path: Path,
+    swap: bool,
+    prefer: Optional[mergetool.Preference],
+) -> None:
+    """Conflicting files are merged if all of them are in the store."""
+    store = FileStore(tmp_path, merge_files=True)
+    value, other = lockfile_with_click, lockfile_with_click_and_other_files
+    for lockfile in (value, other):
+        store.add("click", "7.0", lockfile["metadata"]["files"]["click"])
+    if swap:
+        value, other = other, value
+    lockfile = mergetool.merge(value, other, prefer, store)
+    assert lockfile["metadata"]["files"]["click"] == (
+        value["metadata"]["files"]["click"] + other["metadata"]["files"]["click"]
+    )
+
+
+@pytest.mark.parametrize("swap", [False, True])
+def test_merge_fails_on_files_partially_in_store(
+    lockfile_with_click: _TOMLDocument,
+    lockfile_with_click_and_other_files: _TOMLDocument,
+    tmp_path: Path,
+    swap: bool,
+) -> None:
+    """Conflicting files are not merged if some of them are not in the store."""
+    store = FileStore(tmp_path, merge_files=True)
+    store.add("click", "7.0", lockfile_with_click["metadata"]["files"]["click"])
+    value, other = lockfile_with_click, lockfile_with_click_and_other_files
+    if swap:
+        value, other = other, value
+    with pytest.raises(mergetool.MergeConflictError):
+        mergetool.merge(value, other, store=store)
+
+
+def test_merge_does_not_merge_stored_files_by_default(
+    lockfile_with_click: _TOMLDocument,
+    lockfile_with_click_and_other_files: _TOMLDocument,
+    tmp_path: Path,
+) -> None:
+    """Conflicting files are only merged using the store if enabled."""
+    store = FileStore(tmp_path)
+    value, other = lockfile_with_click, lockfile_with_click_and_other_files
+    for lockfile in (value, other):
+        store.add("click", "7.0", lockfile["metadata"]["files"]["click"])
+    with pytest.raises(mergetool.MergeConflictError):
+        mergetool.merge(value, other, store=store)
+
+
+def test_merge_fails_on_files_missing_from_store(
+    lockfile_with_click: _TOMLDocument,
+    lockfile_with_click_and_other_files: _TOMLDocument,
+    tmp_path: Path,
+) -> None:
+    """Conflicting files are not merged if neither version is in the store."""
+    with pytest.raises(mergetool.MergeConflictError):
+        mergetool.merge(
+            lockfile_with_click,
+            lockfile_with_click_and_other_files,
+            store=FileStore(tmp_path, merge_files=True),
+        )
+
+
+def test_merge_does_not_modify_store(
+    lockfile_with_attrs: _TOMLDocument,
+    lockfile_with_click: _TOMLDocument,
+    tmp_path: Path,
+) -> None:
+    """Merged package files are not added to the store."""
+    store = FileStore(tmp_path, merge_files=True)
+    mergetool.merge(lockfile_with_attrs, lockfile_with_click, store=store)
+    assert store.get("attrs", "19.3.0") is None
+
+
+def test_merge_with_preference_ignores_store(
+    lockfile_with_click: _TOMLDocument,
+    lockfile_with_click6: _TOMLDocument,
+    tmp_path: Path,
+) -> None:
+    """Files of conflicting packages are taken from the preferred version."""
+    store = FileStore(tmp_path)
+    store.add("click", "6.0", lockfile_with_click["metadata"]["files"]["click"])
+    lockfile = mergetool.merge(
+        lockfile_with_click, lockfile_with_click6, mergetool.Preference.THEIRS, store
+    )
+    files = lockfile_with_click6["metadata"]["files"]["click"]
+    assert lockfile["metadata"]["files"]["click"] == files
+
+
+def test_add_package_files(
+    lockfile_with_attrs: _TOMLDocument,
+    lockfile_with_click: _TOMLDocument,
+    tmp_path: Path,
+) -> None:
+    """The files of merged packages are added to the store."""
+    store = FileStore(tmp_path)
+    lockfile = mergetool.merge(lockfile_with_attrs, lockfile_with_click)
+    mergetool.add_package_files(lockfile, store, {"click"})
+    files = lockfile_with_attrs["metadata"]["files"]["attrs"]
+    assert store.get("attrs", "19.3.0") == files
+    assert store.get("click", "7.0") is None
@@ -0,0 +1,108 @@
+"""Tests for the store module."""
+import os
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from poetry_merge_lock.store import FileStore
+
+
+@pytest.fixture
+def store(tmp_path: Path) -> FileStore:
+    """Empty store in a temporary directory."""
+    return FileStore(tmp_path / "store")
+
+
+def test_get_returns_none_for_missing_package(store: FileStore) -> None:
+    """It returns None if the package is not in the store."""
+    assert store.get("click", "7.0") is None
+
+
+def test_get_returns_added_files(store: FileStore) -> None:
+    """It returns the files added for the package version."""
+    files = [{"file": "click-7.0.tar.gz", "hash": "sha256:0"}]
+    store.add("click", "7.0", files)
+    assert store.get("click", "7.0") == files
+    assert store.get("click", "7.1") is None
+
+
+def test_get_returns_files_of_all_entries(store: FileStore) -> None:
+    """It returns every file recorded for the package version."""
+    files = [
+        {"file": "click-7.0.tar.gz", "hash": "sha256:0"},
+        {"file": "click-7.0.tar.gz", "hash": "sha256:1"},
+    ]
+    store.add("click", "7.0", files[:1])
+    store.add("click", "7.0", files[1:])
+    store.add("click", "7.0", files)
+    assert store.get("click", "7.0") == files
+
+
+def test_get_ignores_removed_entries(
+    store: FileStore, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """It ignores entries removed while they are being read."""
+
+    def utime(path: Path) -> None:
+        raise FileNotFoundError(path)
+
+    store.add("click", "7.0", [{"file": "click-7.0.tar.gz", "hash": "sha256:0"}])
+    monkeypatch.setattr(os, "utime", utime)
+    assert store.get("click", "7.0") is None
+
+
+def test_add_does_not_rewrite_entries(store: FileStore) -> None:
+    """It does not write files which were recorded before."""
+    files = [{"file": "click-7.0.tar.gz", "hash": "sha256:0"}]
+    store.add("click", "7.0", files)
+    path = store.path("click", "7.0", files)
+    os.utime(path, (0, 0))
+    store.add("click", "7.0", files)
+    assert path.stat().st_mtime == 0
+
+
+def test_add_ignores_empty_files(store: FileStore) -> None:
+    """It does not store packages without files."""
+    store.add("click", "7.0", [])
+    assert store.get("click", "7.0") is None
+
+
+def test_prune_removes_least_recently_used(store: FileStore) -> None:
+    """It removes the oldest entries until the store is small enough."""
+    paths = {}
+
+    for index, version in enumerate(["6.0", "7.0", "7.1"]):
+        files = [{"file": "click-{}.tar.gz".format(version)}]
+        store.add("click", version, files)
+        paths[version] = store.path("click", version, files)
+        os.utime(paths[version], (index, index))
+
+    store.get("click", "6.0")
+    size = paths["7.1"].stat().st_size
+
+    assert store.prune(2 * size) == 1
+    assert store.get("click", "7.0") is None
+    assert store.get("click", "6.0") is not None
+
+
+@pytest.mark.parametrize("method", ["stat", "unlink"])
+def test_prune_ignores_removed_entries(
+    store: FileStore, monkeypatch: pytest.MonkeyPatch, method: str
+) -> None:
+    """It ignores entries removed by a concurrent prune."""
+    original = getattr(Path, method)
+
+    def remove(path: Path, *args: Any, **kwargs: Any) -> Any:
+        if path.suffix == ".json":
+            raise FileNotFoundError(path)
+        return original(path, *args, **kwargs)
+
+    store.add("click", "7.0", [{"file": "click-7.0.tar.gz"}])
+    monkeypatch.setattr(Path, method, remove)
+    assert store.prune(0) == 0
+
+
+def test_prune_ignores_missing_directory(store: FileStore) -> None:
+    """It does nothing if the store does not exist."""
+    assert store.prune(0) == 0
@@ -0,0 +1,154 @@
+"""Tests for the watch module."""
+import subprocess  # noqa: S404
+from pathlib import Path
+
+import pytest
+from poetry.puzzle.exceptions import SolverProblemError
+
+from poetry_merge_lock import watch
+
+
+PYPROJECT = """\
+[tool.poetry]
+name = "example"
+version = "0.1.0"
+description = ""
+authors = []
+
+[tool.poetry.dependencies]
+python = "^3.7"
+"""
+
+LOCK = """\
+<<<<<<< HEAD
+[[package]]
+category = "main"
+description = "Classes Without Boilerplate"
+name = "attrs"
+optional = false
+python-versions = "*"
+version = "19.3.0"
+=======
+[[package]]
+category = "main"
+description = "Composable command line interface toolkit"
+name = "click"
+optional = false
+python-versions = "*"
+version = "7.0"
+>>>>>>> Add click
+
+[metadata]
+content-hash = "0000000000000000000000000000000000000000000000000000000000000000"
+python-versions = "^3.7"
+
+[metadata.files]
+<<<<<<< HEAD
+attrs = [
+    {file = "attrs-19.3.0.tar.gz", hash = "sha256:0000"},
+]
+=======
+click = [
+    {file = "click-7.0.tar.gz", hash = "sha256:7000"},
+]
+>>>>>>> Add click
+"""
+
+
+@pytest.fixture
+def project(tmp_path: Path) -> Path:
+    """Git repository with a Poetry project."""
+    (tmp_path / "pyproject.toml").write_text(PYPROJECT)
+    subprocess.run(["git", "init", "--quiet"], cwd=str(tmp_path), check=True)
+    return tmp_path
+
+
+def git_status(project: Path) -> str:
+    """Return the short status of the lock file."""
+    process = subprocess.run(
+        ["git", "status", "--porcelain", "poetry.lock"],
+        cwd=str(project),
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    return process.stdout
+
+
+def test_poll_without_lock_file(project: Path) -> None:
+    """It does nothing if there is no lock file."""
+    assert not watch.Watcher(project).poll()
+
+
+def test_poll_resolves_conflicts(project: Path) -> None:
+    """It resolves merge conflicts and stages the lock file."""
+    lock = project / "poetry.lock"
+    lock.write_text(LOCK)
+    watcher = watch.Watcher(project)
+
+    assert watcher.poll()
+    assert not watch.has_conflicts(lock)
+    assert 'name = "attrs"' in lock.read_text()
+    assert 'name = "click"' in lock.read_text()
+    assert git_status(project) == "A  poetry.lock\n"
+    assert not watcher.poll()
+
+
+def test_poll_ignores_lock_file_without_conflicts(project: Path) -> None:
+    """It does not modify the lock file if there are no conflicts."""
+    lock = project / "poetry.lock"
+    lock.write_text("[metadata]\n")
+
+    assert not watch.Watcher(project).poll()
+    assert git_status(project) == "?? poetry.lock\n"
+
+
+def test_watch_reports_errors(project: Path) -> None:
+    """It reports errors and keeps watching."""
+    lock = project / "poetry.lock"
+    lock.write_text("<<<<<<< HEAD\n")
+
+    [error] = watch.watch(watch.Watcher(project), 0, polls=2)
+
+    assert isinstance(error, ValueError)
+
+
+def test_watch_reports_solver_errors(
+    project: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """It reports errors raised by the solver and keeps watching."""
+
+    def merge_lock(*args: object) -> None:
+        raise SolverProblemError("version solving failed")
+
+    monkeypatch.setattr(watch, "merge_lock", merge_lock)
+    (project / "poetry.lock").write_text(LOCK)
+
+    [error] = watch.watch(watch.Watcher(project), 0, polls=2)
+
+    assert isinstance(error, SolverProblemError)
+
+
+def test_poetry_is_loaded_on_creation(
+    project: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """It loads the project before the first conflict appears."""
+    watcher = watch.Watcher(project)
+    monkeypatch.setattr(watch, "Factory", None)
+    assert watcher.poetry.package.name == "example"
+
+
+def test_poetry_is_reloaded_when_pyproject_changes(project: Path) -> None:
+    """It reloads the project only if pyproject.toml was modified."""
+    watcher = watch.Watcher(project)
+    poetry = watcher.poetry
+    assert watcher.poetry is poetry
+
+    (project / "pyproject.toml").write_text(PYPROJECT + 'attrs = "*"\n')
+    assert watcher.poetry is not poetry
+
+
+def test_watch_reports_resolved_conflicts(project: Path) -> None:
+    """It reports every resolution of merge conflicts."""
+    (project / "poetry.lock").write_text(LOCK)
+    assert list(watch.watch(watch.Watcher(project), 0, polls=2)) == [None]